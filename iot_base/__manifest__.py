@@ -4,15 +4,20 @@
     "author": "Ricardo Perez (ric98esley)",
     "website": "https://github.com/ric98esley/odoo_iot",
     "category": "IoT",
-    "version": "18.0.0.0.1",
+    "version": "18.0.0.0.2",
     "depends": ["base"],
     "data": [
         "security/iot_security.xml",
         "security/ir.model.access.csv",
+        "data/iot_cron.xml",
+        "data/iot_permission_template_data.xml",
         "views/iot_credentials_views.xml",
         "views/iot_device_type_views.xml",
         "views/iot_devices_views.xml",
+        "views/iot_device_meter_views.xml",
         "views/iot_permission_views.xml",
+        "views/iot_permission_template_views.xml",
+        "views/iot_audit_log_views.xml",
         "views/res_users_views.xml",
         "views/res_config_settings_views.xml",
         "views/iot_app_view.xml",
@@ -1,7 +1,14 @@
+import logging
 import re
+import secrets
 
+from odoo import fields
 from odoo.http import Controller, request, route
 
+from ..tools import audit, auth_cache, metering
+
+_logger = logging.getLogger(__name__)
+
 
 class IotDevicesController(Controller):
     def _mqtt_topic_matches(self, topic_pattern, topic):
@@ -35,6 +42,32 @@ class IotDevicesController(Controller):
 
         return bool(re.match(pattern, topic))
 
+    def _acl_deny(self, username, topic, action, reason):
+        """Audit a denied ACL decision and build the matching EMQX response"""
+        audit.record_decision(
+            request.env, "acl", "deny", username, topic, action, reason
+        )
+        return request.make_json_response(
+            {"result": "deny", "reason": reason}, status=403
+        )
+
+    def _get_auth_snapshot(self, username):
+        """Cached, coalesced credential/permission lookup (see AuthCache)"""
+        request.env["iot.credentials"].sudo()._ensure_auth_cache_warm()
+        return auth_cache.get_cache(request.env.cr.dbname).get(
+            username, request.env["iot.credentials"].sudo()._get_auth_snapshot
+        )
+
+    def _overloaded(self, event, username, topic=None, action=None):
+        """Response used when the worker is already busy with DB lookups"""
+        _logger.warning("IoT auth lookup rejected for %s: worker overloaded", username)
+        audit.record_decision(
+            request.env, event, "ignore", username, topic, action, "Service overloaded"
+        )
+        return request.make_json_response(
+            {"result": "ignore", "error": "Service overloaded"}, status=503
+        )
+
     @route("/iot/auth/<token>", auth="none", type="http", methods=["POST"], csrf=False)
     def auth_device(self, token, **kwargs):
         """
@@ -61,14 +94,18 @@ class IotDevicesController(Controller):
                 status=400,
             )
 
-        # Search in unified credentials table (works for both users and devices)
-        credential = (
-            request.env["iot.credentials"]
-            .sudo()
-            .search([("name", "=", username), ("password", "=", password)], limit=1)
-        )
-
-        if not credential:
+        # Unified credentials (works for both users and devices)
+        try:
+            credential = self._get_auth_snapshot(username)
+        except auth_cache.AdmissionRejected:
+            return self._overloaded("auth", username)
+
+        if not credential or not secrets.compare_digest(
+            str(credential["password"]).encode(), str(password).encode()
+        ):
+            audit.record_decision(
+                request.env, "auth", "deny", username, reason="Invalid credentials"
+            )
             return request.make_json_response(
                 {
                     "result": "deny",
@@ -76,11 +113,12 @@ class IotDevicesController(Controller):
                 status=403,
             )
 
+        audit.record_decision(request.env, "auth", "allow", username)
         return request.make_json_response(
             {
                 "result": "allow",
-                "is_superuser": credential.is_superuser,
-                "resource_type": credential.resource_type,
+                "is_superuser": credential["is_superuser"],
+                "resource_type": credential["resource_type"],
             }
         )
 
@@ -137,69 +175,135 @@ class IotDevicesController(Controller):
 
         try:
             # Check if credential exists and is a superuser
-            credential = (
-                request.env["iot.credentials"]
-                .sudo()
-                .search([("name", "=", username)], limit=1)
-            )
+            credential = self._get_auth_snapshot(username)
 
             if not credential:
-                return request.make_json_response(
-                    {"result": "deny", "reason": "Credential not found"}, status=403
-                )
+                return self._acl_deny(username, topic, action, "Credential not found")
 
             # Superusers have access to all topics
-            if credential.is_superuser:
+            if credential["is_superuser"]:
+                audit.record_decision(
+                    request.env, "acl", "allow", username, topic, action, "Superuser"
+                )
                 return request.make_json_response({"result": "allow"}, status=200)
 
-            # Search for matching permissions
-            # Get all active permissions for this credential
-            permissions = (
-                request.env["iot.permission"]
-                .sudo()
-                .search(
-                    [
-                        ("iot_credential_id", "=", credential.id),
-                        ("active", "=", True),
-                        "|",
-                        ("action", "=", action),
-                        ("action", "=", "all"),
-                    ]
+            # Devices over their daily quota may not publish (checked in memory)
+            if (
+                action == "publish"
+                and credential["device_uid"]
+                and metering.get_meter(request.env.cr.dbname).is_over_quota(
+                    credential["device_uid"], username
                 )
-            )
+            ):
+                return self._acl_deny(username, topic, action, "Quota exceeded")
+
+            # Active permissions of this credential for the requested action
+            permissions = [
+                perm_topic
+                for perm_topic, perm_action in credential["permissions"]
+                if perm_action in (action, "all")
+            ]
 
             if not permissions:
-                return request.make_json_response(
-                    {"result": "deny", "reason": "No permissions found"}, status=403
-                )
+                return self._acl_deny(username, topic, action, "No permissions found")
 
             # Check if any permission matches the topic (considering wildcards)
-            for permission in permissions:
-                if self._mqtt_topic_matches(permission.topic, topic):
+            for permission_topic in permissions:
+                if self._mqtt_topic_matches(permission_topic, topic):
+                    audit.record_decision(
+                        request.env, "acl", "allow", username, topic, action
+                    )
                     return request.make_json_response({"result": "allow"}, status=200)
 
             # No matching permission found
-            return request.make_json_response(
-                {"result": "deny", "reason": "No matching topic permission"}, status=403
+            return self._acl_deny(
+                username, topic, action, "No matching topic permission"
             )
 
+        except auth_cache.AdmissionRejected:
+            return self._overloaded("acl", username, topic, action)
+
         except Exception as e:
-            # Log error and return ignore
-            request.env["ir.logging"].sudo().create(
-                {
-                    "name": "iot.acl.error",
-                    "type": "server",
-                    "level": "error",
-                    "message": f"Authorization error for "
-                    f"{username} on {topic} - {str(e)}",
-                    "path": "iot_base.controllers.api",
-                    "func": "authorize_topic",
-                }
+            # Log error and return ignore. The audit record is written later by
+            # the audit flusher, not in this (possibly broken) transaction.
+            _logger.exception("Authorization error for %s on %s", username, topic)
+            audit.record_decision(
+                request.env, "acl", "ignore", username, topic, action, str(e)[:255]
             )
             return request.make_json_response(
                 {"result": "ignore", "error": "Internal error"}, status=403
             )
 
+    @route(
+        "/iot/metering/<token>", auth="none", type="http", methods=["POST"], csrf=False
+    )
+    def meter_messages(self, token, **kwargs):
+        """
+        EMQX message metering endpoint - counts messages and bytes per device
+
+        Accepts a single 'message.publish' webhook event or a list of them (rule
+        engine batch):
+        {
+            "topic": "1/dev_abc123/temperature/sdata",
+            "username": "device_sensor_dev_abc123",  // optional, publisher
+            "payload": "{\"value\": 21.5}",
+            "payload_size": 15,  // optional, bytes (defaults to payload length)
+            "timestamp": 1700000000000  // optional, milliseconds
+        }
+
+        The token must match the 'iot_base.metering_token' system parameter.
+        Messages on topics that are not device topics are ignored, invalid ones
+        (bad username, payload_size or timestamp) are rejected. Sensor data is
+        only charged to a device when the device itself published it. Counts
+        are aggregated in memory and written to iot.device.meter periodically.
+
+        Response:
+        {
+            "result": "ok",
+            "accepted": 1,
+            "rejected": 0
+        }
+        """
+        expected_token = (
+            request.env["ir.config_parameter"]
+            .sudo()
+            .get_param("iot_base.metering_token")
+        )
+        if not (
+            token
+            and expected_token
+            and secrets.compare_digest(token.encode(), expected_token.encode())
+        ):
+            return request.make_json_response(
+                {"result": "ignore", "error": "Invalid token"}, status=403
+            )
+
+        data = request.get_json_data()
+        messages = data if isinstance(data, list) else [data]
+        now = fields.Datetime.now()
+
+        # Validate the whole batch before counting anything, so a bad message
+        # never leaves part of the batch counted (EMQX would retry it)
+        records = []
+        rejected = 0
+        for message in messages:
+            try:
+                record = metering.parse_message(message, now)
+            except (TypeError, ValueError) as e:
+                _logger.warning("IoT metering message rejected: %s", e)
+                rejected += 1
+                continue
+            if record:
+                records.append(record)
+
+        meter = metering.get_meter(request.env.cr.dbname)
+        for record in records:
+            meter.record(*record)
+
+        return request.make_json_response(
+            {"result": "ok", "accepted": len(records), "rejected": rejected}
+        )
+
     @route("/iot/devices", auth="user")
     def devices(self):
         return request.make_json_response(
@@ -0,0 +1,41 @@
+import logging
+
+from odoo import SUPERUSER_ID, api
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATES = (
+    "iot_base.permission_template_device_sdata",
+    "iot_base.permission_template_device_acdata",
+    "iot_base.permission_template_user_publish",
+    "iot_base.permission_template_user_subscribe",
+)
+
+
+def migrate(cr, version):
+    """
+    Bring permissions created before permission templates under their control
+
+    1. Permissions without template that match what a default template renders
+       are linked to it, so they are managed like templated permissions from
+       now on. Only the remaining permissions without template are hand-managed.
+    2. Every active credential is re-materialized, so existing users and
+       devices get the permissions of all templates that apply to them.
+    """
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    templates = env["iot.permission.template"].browse()
+    for xmlid in DEFAULT_TEMPLATES:
+        templates |= env.ref(xmlid, raise_if_not_found=False) or templates.browse()
+    credential_ids = set(env["iot.credentials"].search([]).ids)
+
+    adopted = templates._adopt_permissions(credential_ids)
+    counts = templates._rematerialize(credential_ids)
+    _logger.info(
+        "IoT permission templates: %s existing permission(s) adopted, "
+        "%s created, %s archived",
+        adopted,
+        counts["created"],
+        counts["removed"],
+    )
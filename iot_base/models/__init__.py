@@ -1,6 +1,10 @@
+from . import iot_audit_log
 from . import iot_credentials
 from . import iot_devices
+from . import iot_device_meter
 from . import iot_device_type
 from . import iot_permission
+from . import iot_permission_template
+from . import res_company
 from . import res_config_settings
 from . import res_user
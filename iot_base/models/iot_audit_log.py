@@ -0,0 +1,167 @@
+import logging
+from datetime import datetime, timedelta
+from functools import partial
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+# Partitions known to exist (created by a committed transaction), per
+# database, for the current process
+_known_partitions = {}
+
+
+class IotAuditLog(models.Model):
+    _name = "iot.audit.log"
+    _description = "IoT Auth/ACL Decision Audit Log"
+    _auto = False
+    _order = "timestamp desc"
+    _rec_name = "username"
+
+    day = fields.Date(readonly=True)
+    timestamp = fields.Datetime(readonly=True)
+    event = fields.Selection(
+        [("auth", "Authentication"), ("acl", "Authorization")],
+        readonly=True,
+    )
+    result = fields.Selection(
+        [("allow", "Allow"), ("deny", "Deny"), ("ignore", "Ignore")],
+        readonly=True,
+    )
+    username = fields.Char(readonly=True)
+    topic = fields.Char(readonly=True)
+    action = fields.Selection(
+        [("publish", "Publish"), ("subscribe", "Subscribe")],
+        readonly=True,
+    )
+    reason = fields.Char(readonly=True)
+
+    def init(self):
+        """
+        Create the audit table partitioned by day
+
+        Records are only ever inserted in batches by the audit flusher and old
+        days are removed by dropping whole partitions, so the table is managed
+        here instead of by the ORM.
+        """
+        self.env.cr.execute(
+            SQL(
+                """
+                CREATE SEQUENCE IF NOT EXISTS %(seq)s;
+                CREATE TABLE IF NOT EXISTS %(table)s (
+                    id bigint NOT NULL DEFAULT nextval(%(seq_name)s),
+                    day date NOT NULL,
+                    timestamp timestamp without time zone NOT NULL,
+                    event varchar NOT NULL,
+                    result varchar NOT NULL,
+                    username varchar,
+                    topic varchar,
+                    action varchar,
+                    reason varchar,
+                    PRIMARY KEY (id, day)
+                ) PARTITION BY RANGE (day);
+                CREATE INDEX IF NOT EXISTS %(index)s
+                    ON %(table)s (username, timestamp);
+                """,
+                seq=SQL.identifier(f"{self._table}_id_seq"),
+                seq_name=f"{self._table}_id_seq",
+                table=SQL.identifier(self._table),
+                index=SQL.identifier(f"{self._table}_username_timestamp_index"),
+            )
+        )
+        self._ensure_partitions(self._upcoming_days())
+
+    def _upcoming_days(self, count=3):
+        today = fields.Date.today()
+        return [today + timedelta(days=offset) for offset in range(count)]
+
+    def _partition_name(self, day):
+        return f"{self._table}_{day:%Y%m%d}"
+
+    def _ensure_partitions(self, days):
+        """Create the daily partitions for ``days`` if they do not exist yet"""
+        known = _known_partitions.setdefault(self.env.cr.dbname, set())
+        for day in sorted(set(days) - known):
+            try:
+                with self.env.cr.savepoint(flush=False):
+                    self.env.cr.execute(
+                        SQL(
+                            "CREATE TABLE IF NOT EXISTS %s PARTITION OF %s"
+                            " FOR VALUES FROM (%s) TO (%s)",
+                            SQL.identifier(self._partition_name(day)),
+                            SQL.identifier(self._table),
+                            day,
+                            day + timedelta(days=1),
+                        )
+                    )
+            except (psycopg2.errors.DuplicateTable, psycopg2.errors.UniqueViolation):
+                # Another worker created it concurrently
+                pass
+            # CREATE TABLE is transactional: only trust it once committed
+            self.env.cr.postcommit.add(partial(known.add, day))
+
+    @api.model
+    def _insert_batch(self, records):
+        """
+        Insert queued audit records in a single statement
+
+        Args:
+            records: list of (timestamp, event, result, username, topic,
+                action, reason) tuples
+        """
+        if not records:
+            return
+        rows = [(record[0].date(), *record) for record in records]
+        self._ensure_partitions({row[0] for row in rows})
+        execute_values(
+            self.env.cr._obj,
+            f"INSERT INTO {self._table} (day, timestamp, event, result,"
+            " username, topic, action, reason) VALUES %s",
+            rows,
+            page_size=1000,
+        )
+
+    @api.model
+    def _cron_maintain_partitions(self):
+        """
+        Create the partitions of the coming days and drop the expired ones
+
+        Retention is read from the ``iot_base.audit_retention_days`` system
+        parameter (0 keeps everything).
+        """
+        self._ensure_partitions(self._upcoming_days())
+
+        retention_days = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("iot_base.audit_retention_days", 30)
+        )
+        if retention_days <= 0:
+            return
+
+        cutoff = fields.Date.today() - timedelta(days=retention_days)
+        self.env.cr.execute(
+            """
+            SELECT child.relname
+              FROM pg_inherits
+              JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+              JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+             WHERE parent.relname = %s
+            """,
+            [self._table],
+        )
+        known = _known_partitions.setdefault(self.env.cr.dbname, set())
+        prefix = f"{self._table}_"
+        for (name,) in self.env.cr.fetchall():
+            try:
+                day = datetime.strptime(name.removeprefix(prefix), "%Y%m%d").date()
+            except ValueError:
+                continue
+            if day < cutoff:
+                _logger.info("Dropping expired IoT audit partition %s", name)
+                self.env.cr.execute(SQL("DROP TABLE %s", SQL.identifier(name)))
+                known.discard(day)
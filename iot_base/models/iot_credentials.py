@@ -1,5 +1,11 @@
+import logging
+
 from odoo import _, api, fields, models
 
+from ..tools import auth_cache
+
+_logger = logging.getLogger(__name__)
+
 
 class IotCredentials(models.Model):
     _name = "iot.credentials"
@@ -37,6 +43,134 @@ class IotCredentials(models.Model):
         help="Uncheck to archive credentials without deleting them",
     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        credentials = super().create(vals_list)
+        auth_cache.invalidate(self.env, credentials.mapped("name"))
+        return credentials
+
+    def write(self, vals):
+        usernames = self.mapped("name")
+        res = super().write(vals)
+        auth_cache.invalidate(self.env, usernames + self.mapped("name"))
+        return res
+
+    def unlink(self):
+        auth_cache.invalidate(self.env, self.mapped("name"))
+        return super().unlink()
+
+    def _register_hook(self):
+        """Warm the auth cache so the first reconnect storm hits a warm worker"""
+        super()._register_hook()
+        self._ensure_auth_cache_warm()
+
+    @api.model
+    def _ensure_auth_cache_warm(self):
+        """
+        Warm the auth cache of the current process if it was not yet
+
+        Called when the registry loads and by the EMQX endpoints, so worker
+        processes forked after the registry was loaded are warmed on their first
+        request instead of inheriting entries that may have expired long ago.
+        """
+        cache = auth_cache.get_cache(self.env.cr.dbname)
+        if not cache.needs_warmup():
+            return
+        try:
+            with self.env.cr.savepoint():
+                cache.warm_up(self._warm_up_auth_cache)
+        except Exception:
+            _logger.exception("IoT auth cache warm-up failed")
+
+    @api.model
+    def _get_auth_snapshot(self, username):
+        """
+        Load what the EMQX endpoints need to know about a username
+
+        Args:
+            username: MQTT username
+
+        Returns:
+            dict or None: Credential data and its active permissions as a list
+            of (topic, action) tuples, or None if there is no such credential
+        """
+        credential = self.sudo().search([("name", "=", username)], limit=1)
+        if not credential:
+            return None
+        permissions = (
+            self.env["iot.permission"]
+            .sudo()
+            .search_read(
+                [("iot_credential_id", "=", credential.id), ("active", "=", True)],
+                ["topic", "action"],
+            )
+        )
+        return {
+            "id": credential.id,
+            "password": credential.password,
+            "is_superuser": credential.is_superuser,
+            "resource_type": credential.resource_type,
+            "device_uid": credential.device_id.device_uid,
+            "permissions": [(perm["topic"], perm["action"]) for perm in permissions],
+        }
+
+    @api.model
+    def _warm_up_auth_cache(self):
+        """
+        Preload auth snapshots of the most recently changed active credentials
+        with two bulk queries
+        """
+        cache = auth_cache.get_cache(self.env.cr.dbname)
+        if cache.warmup_limit <= 0:
+            return
+
+        self.env.cr.execute(
+            """
+            SELECT c.id, c.name, c.password, c.is_superuser, c.resource_type,
+                   d.device_uid
+              FROM iot_credentials c
+              LEFT JOIN iot_devices d ON d.id = c.device_id
+             WHERE c.active
+             ORDER BY c.write_date DESC NULLS LAST
+             LIMIT %s
+            """,
+            [cache.warmup_limit],
+        )
+        snapshots = {}
+        by_id = {}
+        for (
+            cred_id,
+            name,
+            password,
+            is_superuser,
+            resource_type,
+            device_uid,
+        ) in self.env.cr.fetchall():
+            by_id[cred_id] = snapshots[name] = {
+                "id": cred_id,
+                "password": password,
+                "is_superuser": bool(is_superuser),
+                "resource_type": resource_type,
+                "device_uid": device_uid,
+                "permissions": [],
+            }
+        if not snapshots:
+            return
+
+        self.env.cr.execute(
+            """
+            SELECT iot_credential_id, topic, action
+              FROM iot_permission
+             WHERE active AND iot_credential_id = ANY(%s)
+            """,
+            [list(by_id)],
+        )
+        for cred_id, topic, action in self.env.cr.fetchall():
+            by_id[cred_id]["permissions"].append((topic, action))
+
+        cache.fill(snapshots)
+        _logger.info("IoT auth cache warmed with %s credentials", len(snapshots))
+
     @api.constrains("resource_type", "user_id", "device_id")
     def _check_resource_consistency(self):
         for record in self:
@@ -0,0 +1,123 @@
+from datetime import datetime, time
+
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models
+
+
+class BigInteger(fields.Integer):
+    """Integer field stored as int8, for counters that can exceed 2^31"""
+
+    column_type = ("int8", "int8")
+
+
+class IotDeviceMeter(models.Model):
+    _name = "iot.device.meter"
+    _description = "IoT Device Traffic Counters"
+    _log_access = False
+    _order = "bucket_start desc, device_id"
+    _rec_name = "device_id"
+
+    device_id = fields.Many2one(
+        "iot.devices",
+        string="Device",
+        required=True,
+        ondelete="cascade",
+        readonly=True,
+    )
+    direction = fields.Selection(
+        [("sdata", "Sensor Data"), ("acdata", "Action/Command Data")],
+        required=True,
+        readonly=True,
+    )
+    bucket_start = fields.Datetime(required=True, readonly=True, index=True)
+    messages = BigInteger(readonly=True)
+    bytes = BigInteger(readonly=True)
+
+    _sql_constraints = [
+        (
+            "unique_device_direction_bucket",
+            "UNIQUE(device_id, direction, bucket_start)",
+            "Only one counter per device, direction and time bucket",
+        ),
+    ]
+
+    @api.model
+    def _add_counts(self, counts):
+        """
+        Add aggregated counts with a single additive upsert
+
+        Traffic is charged to the device whose UID and company are the second
+        and first levels of the topic. Sensor data (sdata) is only charged when
+        it was published by one of the device's own credentials, so a user
+        publishing on a device topic never uses the device's quota.
+
+        Args:
+            counts: dict {(company, device_uid, direction, username,
+                bucket_start): [messages, bytes]} as aggregated by the device
+                meter. Unknown devices are ignored.
+        """
+        if not counts:
+            return
+        rows = [key + tuple(usage) for key, usage in counts.items()]
+        execute_values(
+            self.env.cr._obj,
+            f"""
+            INSERT INTO {self._table}
+                   (device_id, direction, bucket_start, messages, bytes)
+            SELECT d.id, v.direction, v.bucket_start, SUM(v.messages), SUM(v.bytes)
+              FROM (VALUES %s) AS v(company, device_uid, direction, username,
+                                    bucket_start, messages, bytes)
+              JOIN iot_devices d
+                ON d.device_uid = v.device_uid
+               AND d.company_id::text = v.company
+             WHERE v.direction != 'sdata'
+                OR EXISTS (
+                    SELECT 1
+                      FROM iot_credentials c
+                     WHERE c.device_id = d.id AND c.name = v.username
+                )
+             GROUP BY d.id, v.direction, v.bucket_start
+             -- Stable lock order between concurrent workers
+             ORDER BY d.id, v.direction, v.bucket_start
+            ON CONFLICT (device_id, direction, bucket_start) DO UPDATE
+               SET messages = {self._table}.messages + EXCLUDED.messages,
+                   bytes = {self._table}.bytes + EXCLUDED.bytes
+            """,
+            rows,
+            template="(%s, %s, %s, %s::varchar, %s::timestamp, %s::bigint, %s::bigint)",
+            page_size=1000,
+        )
+
+    @api.model
+    def _read_quota_usage(self):
+        """
+        Today's published traffic of the devices that have a daily quota
+
+        Returns:
+            dict: {device_uid: (message_quota, byte_quota, messages, bytes)}
+        """
+        self.env.cr.execute(
+            f"""
+            SELECT d.device_uid,
+                   d.daily_message_quota,
+                   d.daily_byte_quota,
+                   COALESCE(SUM(m.messages), 0)::bigint,
+                   COALESCE(SUM(m.bytes), 0)::bigint
+              FROM iot_devices d
+              LEFT JOIN {self._table} m
+                ON m.device_id = d.id
+               AND m.direction = 'sdata'
+               AND m.bucket_start >= %s
+             WHERE d.device_uid IS NOT NULL
+               AND (d.daily_message_quota > 0 OR d.daily_byte_quota > 0)
+             GROUP BY d.id
+            """,
+            [datetime.combine(fields.Date.today(), time.min)],
+        )
+        return {
+            uid: (message_quota, byte_quota, messages, size)
+            for uid, message_quota, byte_quota, messages, size in (
+                self.env.cr.fetchall()
+            )
+        }
@@ -8,3 +8,30 @@ class IotDeviceType(models.Model):
     name = fields.Char()
     description = fields.Text()
     company_id = fields.Many2one("res.company", default=lambda self: self.env.company)
+
+    permission_template_ids = fields.One2many(
+        "iot.permission.template",
+        "device_type_id",
+        string="Permission Templates",
+        context={"active_test": False},
+        help="Topic permissions created for devices of this type, "
+        "in addition to the templates that apply to all devices.",
+    )
+
+    def unlink(self):
+        # Remove the permissions of type-specific templates before the
+        # database cascade deletes the templates without unlink()
+        self.with_context(active_test=False).permission_template_ids.unlink()
+        return super().unlink()
+
+    def action_rematerialize_permissions(self):
+        """Re-apply the device templates to the devices of these types"""
+        credential_ids = set(
+            self.env["iot.devices"]
+            .search([("device_type", "in", self.ids)])
+            .credential_ids.ids
+        )
+        templates = self.env["iot.permission.template"]
+        return templates._rematerialize_notification(
+            templates._rematerialize(credential_ids)
+        )
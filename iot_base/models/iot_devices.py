@@ -4,6 +4,8 @@ import uuid
 
 from odoo import api, fields, models
 
+from .iot_device_meter import BigInteger
+
 
 class IotDevices(models.Model):
     _name = "iot.devices"
@@ -12,7 +14,9 @@ class IotDevices(models.Model):
     name = fields.Char(string="Device Name", required=True)
     device_type = fields.Many2one("iot.device.type")
     device_uid = fields.Char(
-        string="Device UID", default=lambda self: self._generate_device_uid()
+        string="Device UID",
+        default=lambda self: self._generate_device_uid(),
+        index=True,
     )
 
     # Credentials for EMQX authentication
@@ -33,19 +37,46 @@ class IotDevices(models.Model):
 
     company_id = fields.Many2one("res.company", default=lambda self: self.env.company)
 
+    # Traffic metering and quotas
+    meter_ids = fields.One2many(
+        "iot.device.meter",
+        "device_id",
+        string="Traffic",
+    )
+    daily_message_quota = BigInteger(
+        help="Maximum number of sensor data messages (sdata) the device may "
+        "publish per day (UTC). 0 means unlimited.",
+    )
+    daily_byte_quota = BigInteger(
+        help="Maximum number of sensor data bytes (sdata) the device may "
+        "publish per day (UTC). 0 means unlimited.",
+    )
+
     @api.model_create_multi
     def create(self, vals_list):
         """Override create to automatically generate
         credentials with company permissions and topic permissions"""
         devices = super().create(vals_list)
 
-        # Create credentials for each new device
+        # Create credentials for each new device, then materialize the
+        # permissions of the whole batch at once
+        credentials = self.env["iot.credentials"]
         for device in devices:
             if not device.credential_ids:
-                device._create_device_credentials()
+                credentials |= device._create_device_credentials(with_permissions=False)
+        self.env["iot.permission.template"]._rematerialize(set(credentials.ids))
 
         return devices
 
+    def write(self, vals):
+        res = super().write(vals)
+        if {"device_type", "company_id", "device_uid"}.intersection(vals):
+            # Templates depend on these, re-render the device permissions
+            self.env["iot.permission.template"]._rematerialize(
+                set(self.credential_ids.ids)
+            )
+        return res
+
     def _generate_iot_password(self):
         """Generate a secure random password for IoT credentials"""
         alphabet = string.ascii_letters + string.digits
@@ -55,9 +86,14 @@ class IotDevices(models.Model):
         """Generate a unique device UID for the device"""
         return "dev_" + str(uuid.uuid4())[:10]
 
-    def _create_device_credentials(self):
+    def _create_device_credentials(self, with_permissions=True):
         """
         Create MQTT credentials for the device with company-scoped permissions
+
+        Args:
+            with_permissions: Materialize the permission templates for the new
+                credential. Callers creating many devices pass False and
+                materialize the whole batch at once.
         """
         self.ensure_one()
 
@@ -87,15 +123,16 @@ class IotDevices(models.Model):
         )
 
         # Create default permissions for company topics
-        self._create_default_company_permissions(credential)
+        if with_permissions:
+            self._create_default_company_permissions(credential)
 
         return credential
 
     def _create_default_company_permissions(self, credential):
         """
-        Create default MQTT permissions for device with specific topic patterns
+        Create default MQTT permissions for device from the permission templates
 
-        Devices get access to:
+        Default templates give devices access to:
         - Publish: {company_id}/{device_uid}/+/sdata (sensor data)
         - Subscribe: {company_id}/{device_uid}/+/acdata (action/command data)
 
@@ -110,52 +147,14 @@ class IotDevices(models.Model):
         - Publish: 1/5/temperature/sdata
         - Subscribe: 1/5/turn_on/acdata
 
+        Templates of the device type and of the company are applied too, see
+        iot.permission.template.
+
         Args:
             credential: iot.credentials record
         """
         self.ensure_one()
-
-        # Get device's company ID and device ID
-        company_id = self.company_id.id
-        device_id = self.device_uid
-
-        # Topic patterns for device-specific communication
-        # Publish: Device sends sensor data
-        publish_topic = f"{company_id}/{device_id}/+/sdata"
-
-        # Subscribe: Device receives commands/actions
-        subscribe_topic = f"{company_id}/{device_id}/+/acdata"
-
-        # Create permissions
-        permissions_data = [
-            {
-                "iot_credential_id": credential.id,
-                "topic": subscribe_topic,
-                "action": "subscribe",
-                "active": True,
-            },
-            {
-                "iot_credential_id": credential.id,
-                "topic": publish_topic,
-                "action": "publish",
-                "active": True,
-            },
-        ]
-
-        # Create permissions
-        for perm_data in permissions_data:
-            # Check if permission already exists
-            existing = self.env["iot.permission"].search(
-                [
-                    ("iot_credential_id", "=", credential.id),
-                    ("topic", "=", perm_data["topic"]),
-                    ("action", "=", perm_data["action"]),
-                ],
-                limit=1,
-            )
-
-            if not existing:
-                self.env["iot.permission"].create(perm_data)
+        self.env["iot.permission.template"]._rematerialize(set(credential.ids))
 
     def action_regenerate_credentials(self):
         """
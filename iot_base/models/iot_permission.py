@@ -1,4 +1,6 @@
-from odoo import fields, models
+from odoo import api, fields, models
+
+from ..tools import auth_cache
 
 
 class IotPermission(models.Model):
@@ -37,6 +39,41 @@ class IotPermission(models.Model):
 
     active = fields.Boolean(default=True)
 
+    template_id = fields.Many2one(
+        "iot.permission.template",
+        string="Template",
+        ondelete="set null",
+        index=True,
+        readonly=True,
+        help="Template this permission was materialized from. "
+        "Permissions without template are managed by hand.",
+    )
+    template_archived = fields.Boolean(
+        readonly=True,
+        help="Archived because its template no longer produces it. "
+        "Restored if the template produces it again, unlike permissions "
+        "archived by hand.",
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        permissions = super().create(vals_list)
+        auth_cache.invalidate(self.env, permissions.mapped("username"))
+        return permissions
+
+    def write(self, vals):
+        if "active" in vals:
+            # Archived/restored by hand: templates must respect that choice
+            vals = dict(vals, template_archived=False)
+        usernames = self.mapped("username")
+        res = super().write(vals)
+        auth_cache.invalidate(self.env, usernames + self.mapped("username"))
+        return res
+
+    def unlink(self):
+        auth_cache.invalidate(self.env, self.mapped("username"))
+        return super().unlink()
+
     _sql_constraints = [
         (
             "unique_credential_topic_action",
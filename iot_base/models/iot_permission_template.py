@@ -0,0 +1,402 @@
+import logging
+import re
+
+from odoo import _, api, fields, models
+from odoo.exceptions import ValidationError
+from odoo.tools import SQL, split_every
+
+from ..tools import auth_cache
+
+_logger = logging.getLogger(__name__)
+
+PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+PLACEHOLDERS = {
+    "user": {"company_id", "username"},
+    "device": {"company_id", "device_uid", "username"},
+}
+
+# Fields whose change alters the permissions a template materializes
+MATERIALIZED_FIELDS = {
+    "topic",
+    "action",
+    "active",
+    "resource_type",
+    "device_type_id",
+    "company_id",
+}
+
+
+class IotPermissionTemplate(models.Model):
+    _name = "iot.permission.template"
+    _description = "IoT Topic Permission Template"
+    _order = "resource_type, device_type_id, id"
+
+    name = fields.Char(required=True)
+    resource_type = fields.Selection(
+        [("user", "User"), ("device", "Device")],
+        required=True,
+        default="device",
+        help="Kind of credentials this template applies to",
+    )
+    device_type_id = fields.Many2one(
+        "iot.device.type",
+        string="Device Type",
+        ondelete="cascade",
+        index=True,
+        help="Only apply to devices of this type. Leave empty for all devices.",
+    )
+    company_id = fields.Many2one(
+        "res.company",
+        string="Company",
+        ondelete="cascade",
+        index=True,
+        help="Only apply to users/devices of this company. "
+        "Leave empty for all companies.",
+    )
+    topic = fields.Char(
+        required=True,
+        help="MQTT topic pattern with placeholders: {company_id}, {username} and "
+        "{device_uid} (devices only). Example: {company_id}/{device_uid}/+/sdata",
+    )
+    action = fields.Selection(
+        [("subscribe", "Subscribe"), ("publish", "Publish"), ("all", "All")],
+        required=True,
+        default="all",
+    )
+    active = fields.Boolean(default=True)
+
+    permission_ids = fields.One2many(
+        "iot.permission",
+        "template_id",
+        string="Materialized Permissions",
+    )
+
+    @api.constrains("topic", "resource_type", "device_type_id")
+    def _check_topic_placeholders(self):
+        for template in self:
+            if template.device_type_id and template.resource_type != "device":
+                raise ValidationError(
+                    _("Only device templates can be restricted to a device type.")
+                )
+            allowed = PLACEHOLDERS[template.resource_type]
+            unknown = set(PLACEHOLDER_RE.findall(template.topic)) - allowed
+            if unknown:
+                raise ValidationError(
+                    _(
+                        "Unknown placeholder(s) %(unknown)s in topic %(topic)s. "
+                        "Allowed: %(allowed)s",
+                        unknown=", ".join(sorted(unknown)),
+                        topic=template.topic,
+                        allowed=", ".join(sorted(allowed)),
+                    )
+                )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        templates = super().create(vals_list)
+        templates._rematerialize(templates._get_scope_credential_ids())
+        return templates
+
+    def write(self, vals):
+        if not MATERIALIZED_FIELDS.intersection(vals):
+            return super().write(vals)
+        credential_ids = self._get_scope_credential_ids()
+        res = super().write(vals)
+        self._rematerialize(credential_ids | self._get_scope_credential_ids())
+        return res
+
+    def unlink(self):
+        self._rematerialize(
+            self._get_scope_credential_ids(),
+            mode="delete",
+            excluded_template_ids=self.ids,
+        )
+        return super().unlink()
+
+    def action_rematerialize(self):
+        """Button: re-apply these templates to every credential in their scope"""
+        return self._rematerialize_notification(
+            self._rematerialize(self._get_scope_credential_ids())
+        )
+
+    @api.model
+    def _rematerialize_notification(self, counts):
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Permissions Re-materialized"),
+                "message": _(
+                    "%(created)s permission(s) created or restored, "
+                    "%(removed)s archived.",
+                    **counts,
+                ),
+                "type": "success",
+                "sticky": False,
+            },
+        }
+
+    def _flush_materialization_sources(self):
+        """Flush pending ORM writes the raw SQL of this model reads"""
+        for model in (
+            "iot.permission.template",
+            "iot.permission",
+            "iot.credentials",
+            "iot.devices",
+        ):
+            self.env[model].flush_model()
+        self.env["res.users"].flush_model(["company_id"])
+
+    def _credential_company_sql(self):
+        """Company of the user/device behind a credential (aliases c, d, u)"""
+        return SQL("COALESCE(d.company_id, u.company_id, c.company_id)")
+
+    def _get_scope_credential_ids(self):
+        """
+        Active credentials the templates in ``self`` (active or not) apply to
+
+        Returns:
+            set: iot.credentials ids
+        """
+        if not self:
+            return set()
+        self._flush_materialization_sources()
+        conditions = [
+            SQL(
+                "(c.resource_type = %s AND (%s::int IS NULL OR %s = %s)"
+                " AND (%s::int IS NULL OR d.device_type = %s))",
+                template.resource_type,
+                template.company_id.id or None,
+                self._credential_company_sql(),
+                template.company_id.id or None,
+                template.device_type_id.id or None,
+                template.device_type_id.id or None,
+            )
+            for template in self
+        ]
+        self.env.cr.execute(
+            SQL(
+                """
+                SELECT c.id
+                  FROM iot_credentials c
+                  LEFT JOIN iot_devices d ON d.id = c.device_id
+                  LEFT JOIN res_users u ON u.id = c.user_id
+                 WHERE c.active AND (%s)
+                """,
+                SQL(" OR ").join(conditions),
+            )
+        )
+        return {row[0] for row in self.env.cr.fetchall()}
+
+    def _desired_permissions_sql(self, credential_ids, excluded_template_ids):
+        """
+        Permissions the active templates produce for ``credential_ids``, with
+        placeholders rendered in SQL
+
+        Columns: credential_id, template_id, topic, action
+        """
+        return SQL(
+            """
+            SELECT DISTINCT ON (credential_id, topic, action) *
+              FROM (
+                SELECT c.id AS credential_id,
+                       t.id AS template_id,
+                       replace(replace(replace(t.topic,
+                           '{company_id}', COALESCE(%(company)s::text, '')),
+                           '{device_uid}', COALESCE(d.device_uid, '')),
+                           '{username}', c.name) AS topic,
+                       t.action AS action
+                  FROM iot_credentials c
+                  LEFT JOIN iot_devices d ON d.id = c.device_id
+                  LEFT JOIN res_users u ON u.id = c.user_id
+                  JOIN iot_permission_template t
+                    ON t.active
+                   AND t.resource_type = c.resource_type
+                   AND (t.company_id IS NULL OR t.company_id = %(company)s)
+                   AND (t.device_type_id IS NULL
+                        OR t.device_type_id = d.device_type)
+                   AND NOT t.id = ANY(%(excluded)s)
+                 WHERE c.active AND c.id = ANY(%(ids)s)
+              ) rendered
+             ORDER BY credential_id, topic, action, template_id
+            """,
+            company=self._credential_company_sql(),
+            excluded=list(excluded_template_ids),
+            ids=list(credential_ids),
+        )
+
+    def _adopt_permissions(self, credential_ids, chunk=5000):
+        """
+        Link permissions created without template to the templates in ``self``
+
+        Used on upgrade: permissions created before templates existed carry no
+        ``template_id`` and would otherwise count as hand-managed forever. Rows
+        whose (credential, topic, action) equals what one of these templates
+        renders are adopted; their ``active`` flag is kept, so permissions an
+        administrator archived stay archived.
+
+        Args:
+            credential_ids: iot.credentials ids to process
+            chunk: Number of credentials per statement
+
+        Returns:
+            int: Number of permissions adopted
+        """
+        if not self or not credential_ids:
+            return 0
+        self._flush_materialization_sources()
+        others = self.with_context(active_test=False).search(
+            [("id", "not in", self.ids)]
+        )
+        count = 0
+        usernames = set()
+        for ids in split_every(chunk, sorted(credential_ids), list):
+            self.env.cr.execute(
+                SQL(
+                    """
+                    WITH desired AS (%(desired)s)
+                    UPDATE iot_permission p
+                       SET template_id = desired.template_id,
+                           template_archived = FALSE
+                      FROM desired
+                     WHERE p.template_id IS NULL
+                       AND p.iot_credential_id = desired.credential_id
+                       AND p.topic = desired.topic
+                       AND p.action = desired.action
+                    RETURNING p.username
+                    """,
+                    desired=self._desired_permissions_sql(ids, others.ids),
+                )
+            )
+            rows = self.env.cr.fetchall()
+            count += len(rows)
+            usernames.update(row[0] for row in rows)
+        if usernames:
+            self.env["iot.permission"].invalidate_model()
+            auth_cache.invalidate(self.env, usernames)
+        _logger.info("Adopted %s IoT permissions into templates", count)
+        return count
+
+    @api.model
+    def _rematerialize(
+        self, credential_ids, mode="archive", excluded_template_ids=(), chunk=5000
+    ):
+        """
+        Bring template-managed permissions of credentials in line with the
+        active templates, using set-based SQL instead of ORM loops
+
+        For each chunk of credentials:
+
+        - Missing permissions are bulk-inserted. Permissions this pass archived
+          earlier (``template_archived``) are restored. Existing rows are
+          otherwise left alone: permissions archived by an administrator stay
+          archived and permissions created by hand are never taken over.
+        - Managed permissions no template produces anymore are archived
+          (``mode="archive"``) or deleted (``mode="delete"``).
+
+        Permissions created by hand (without template) are never touched.
+
+        Args:
+            credential_ids: iot.credentials ids to process
+            mode: 'archive' or 'delete' for stale managed permissions
+            excluded_template_ids: Templates to ignore (e.g. being deleted)
+            chunk: Number of credentials per statement
+
+        Returns:
+            dict: Number of rows 'created' (inserted or restored) and 'removed'
+        """
+        counts = {"created": 0, "removed": 0}
+        if not credential_ids:
+            return counts
+
+        usernames = set()
+        self._flush_materialization_sources()
+        for ids in split_every(chunk, sorted(credential_ids), list):
+            desired = self._desired_permissions_sql(ids, excluded_template_ids)
+            self.env.cr.execute(
+                SQL(
+                    """
+                    WITH desired AS (%(desired)s)
+                    INSERT INTO iot_permission (
+                        iot_credential_id, iot_device_id, username, topic, action,
+                        active, template_id, template_archived,
+                        create_uid, create_date, write_uid, write_date
+                    )
+                    SELECT desired.credential_id, c.device_id, c.name,
+                           desired.topic, desired.action,
+                           TRUE, desired.template_id, FALSE,
+                           %(uid)s, %(now)s, %(uid)s, %(now)s
+                      FROM desired
+                      JOIN iot_credentials c ON c.id = desired.credential_id
+                    ON CONFLICT (iot_credential_id, topic, action) DO UPDATE
+                       SET active = iot_permission.active
+                                    OR COALESCE(iot_permission.template_archived,
+                                                FALSE),
+                           template_archived = FALSE,
+                           template_id = EXCLUDED.template_id,
+                           write_uid = EXCLUDED.write_uid,
+                           write_date = EXCLUDED.write_date
+                     WHERE iot_permission.template_id IS NOT NULL
+                       AND (iot_permission.template_archived
+                            OR iot_permission.template_id
+                               IS DISTINCT FROM EXCLUDED.template_id)
+                    RETURNING iot_permission.username
+                    """,
+                    desired=desired,
+                    uid=self.env.uid,
+                    now=fields.Datetime.now(),
+                )
+            )
+            created = self.env.cr.fetchall()
+            counts["created"] += len(created)
+
+            if mode == "delete":
+                stale = SQL("DELETE FROM iot_permission p")
+            else:
+                stale = SQL(
+                    "UPDATE iot_permission p"
+                    " SET active = FALSE, template_archived = TRUE,"
+                    " write_uid = %s, write_date = %s",
+                    self.env.uid,
+                    fields.Datetime.now(),
+                )
+            self.env.cr.execute(
+                SQL(
+                    """
+                    WITH desired AS (%(desired)s)
+                    %(stale)s
+                     WHERE p.iot_credential_id = ANY(%(ids)s)
+                       AND p.template_id IS NOT NULL
+                       AND (p.active OR %(delete)s)
+                       AND NOT EXISTS (
+                           SELECT 1 FROM desired
+                            WHERE desired.credential_id = p.iot_credential_id
+                              AND desired.topic = p.topic
+                              AND desired.action = p.action
+                       )
+                    RETURNING p.username
+                    """,
+                    desired=desired,
+                    stale=stale,
+                    ids=ids,
+                    delete=mode == "delete",
+                )
+            )
+            removed = self.env.cr.fetchall()
+            counts["removed"] += len(removed)
+            usernames.update(row[0] for row in created + removed)
+
+        if not usernames:
+            return counts
+
+        self.env["iot.permission"].invalidate_model()
+        auth_cache.invalidate(self.env, usernames)
+        _logger.info(
+            "Re-materialized IoT permissions of %s credentials: "
+            "%s created/restored, %s removed (%s)",
+            len(credential_ids),
+            counts["created"],
+            counts["removed"],
+            mode,
+        )
+        return counts
@@ -0,0 +1,21 @@
+from odoo import fields, models
+
+
+class ResCompany(models.Model):
+    _inherit = "res.company"
+
+    iot_permission_template_ids = fields.One2many(
+        "iot.permission.template",
+        "company_id",
+        string="IoT Permission Templates",
+        help="Topic permissions created for the users and devices of this company, "
+        "in addition to the templates that apply to all companies.",
+    )
+
+    def unlink(self):
+        # Remove the permissions of company templates before the database
+        # cascade deletes the templates without unlink()
+        self.env["iot.permission.template"].with_context(active_test=False).search(
+            [("company_id", "in", self.ids)]
+        ).unlink()
+        return super().unlink()
@@ -31,6 +31,28 @@ class ResConfigSettings(models.TransientModel):
         help="Use secure WebSocket connection (wss://) instead of ws://",
     )
 
+    iot_audit_allow_sample_rate = fields.Float(
+        string="Audit Sample Rate (Allowed)",
+        config_parameter="iot_base.audit_allow_sample_rate",
+        default=0.1,
+        help="Fraction of allowed authentication/authorization decisions written "
+        "to the audit log (0 to 1). Denied decisions are always recorded.",
+    )
+    iot_audit_retention_days = fields.Integer(
+        string="Audit Retention (Days)",
+        config_parameter="iot_base.audit_retention_days",
+        default=30,
+        help="Number of days of audit log kept. Older days are dropped. "
+        "Use 0 to keep everything.",
+    )
+
+    iot_metering_token = fields.Char(
+        string="Metering Webhook Token",
+        config_parameter="iot_base.metering_token",
+        help="Secret expected in the metering webhook URL "
+        "(/iot/metering/<token>). Metering is disabled while empty.",
+    )
+
     @api.onchange("mqtt_broker_host", "mqtt_broker_port", "mqtt_use_ssl")
     def _onchange_mqtt_broker_settings(self):
         """Auto-generate broker URL when host, port or SSL settings change"""
@@ -14,6 +14,15 @@ class ResUser(models.Model):
         string="IoT EMQX Credentials",
     )
 
+    def write(self, vals):
+        res = super().write(vals)
+        if "company_id" in vals:
+            # Templates render {company_id}, re-render the user permissions
+            self.env["iot.permission.template"]._rematerialize(
+                set(self.iot_credential_ids.ids)
+            )
+        return res
+
     def _generate_iot_password(self):
         """Generate a secure random password for IoT credentials"""
         alphabet = string.ascii_letters + string.digits
@@ -47,8 +56,10 @@ class ResUser(models.Model):
                 }
             )
 
-        # Create default permissions for company topics
-        self._create_default_company_permissions(credential)
+            # Create default permissions for company topics. Existing
+            # credentials are kept in line by template and company changes, and
+            # were brought under the templates by the 18.0.0.0.2 migration.
+            self._create_default_company_permissions(credential)
 
         return {
             "username": credential.name,
@@ -58,9 +69,10 @@ class ResUser(models.Model):
 
     def _create_default_company_permissions(self, credential):
         """
-        Create default MQTT permissions for user to access company-scoped topics
+        Create default MQTT permissions for user from the permission templates
 
-        Users get access to topics starting with their company ID:
+        Default templates give users access to topics starting with their
+        company ID:
         - Subscribe: company_id/#
         - Publish: company_id/#
 
@@ -68,40 +80,4 @@ class ResUser(models.Model):
             credential: iot.credentials record
         """
         self.ensure_one()
-
-        # Get user's company ID
-        company_id = self.company_id.id
-
-        # Topic pattern for company namespace
-        company_topic = f"{company_id}/#"
-
-        # Create permissions for subscribe and publish
-        permissions_data = [
-            {
-                "iot_credential_id": credential.id,
-                "topic": company_topic,
-                "action": "subscribe",
-                "active": True,
-            },
-            {
-                "iot_credential_id": credential.id,
-                "topic": company_topic,
-                "action": "publish",
-                "active": True,
-            },
-        ]
-
-        # Create permissions
-        for perm_data in permissions_data:
-            # Check if permission already exists
-            existing = self.env["iot.permission"].search(
-                [
-                    ("iot_credential_id", "=", credential.id),
-                    ("topic", "=", perm_data["topic"]),
-                    ("action", "=", perm_data["action"]),
-                ],
-                limit=1,
-            )
-
-            if not existing:
-                self.env["iot.permission"].create(perm_data)
+        self.env["iot.permission.template"]._rematerialize(set(credential.ids))
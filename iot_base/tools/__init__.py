@@ -0,0 +1,5 @@
+from . import config
+from . import flusher
+from . import audit
+from . import auth_cache
+from . import metering
@@ -0,0 +1,111 @@
+import logging
+import queue
+import random
+import threading
+
+from odoo import fields
+
+from .flusher import BackgroundFlusher
+
+_logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 10000
+FLUSH_INTERVAL = 2.0
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+class AuditBuffer(BackgroundFlusher):
+    """
+    Bounded in-process queue of auth/ACL decisions for one database
+
+    ``push`` never blocks the request path: when the queue is full the record
+    is dropped and counted. The flusher thread batch-inserts queued records
+    into ``iot.audit.log`` and reports how many were dropped since last time.
+    """
+
+    def __init__(self, dbname, maxsize=QUEUE_SIZE, interval=FLUSH_INTERVAL):
+        super().__init__(dbname, interval)
+        self.maxsize = maxsize
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.dropped_total = 0
+        self._dropped_lock = threading.Lock()
+
+    def _reset(self):
+        self.queue = queue.Queue(maxsize=self.maxsize)
+        self.dropped = 0
+
+    def push(self, record):
+        self.ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._count_dropped(1)
+
+    def _count_dropped(self, count):
+        with self._dropped_lock:
+            self.dropped += count
+            self.dropped_total += count
+
+    def _take(self):
+        records = []
+        while True:
+            try:
+                records.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            _logger.warning(
+                "IoT audit queue full, %s records dropped (%s since start)",
+                dropped,
+                self.dropped_total,
+            )
+        return records
+
+    def _flush(self, env, data):
+        env["iot.audit.log"]._insert_batch(data)
+
+    def _discard(self, data):
+        self._count_dropped(len(data))
+
+
+def get_buffer(dbname):
+    """Return the audit buffer of ``dbname`` for the current process"""
+    buffer = _buffers.get(dbname)
+    if buffer is None:
+        with _buffers_lock:
+            buffer = _buffers.setdefault(dbname, AuditBuffer(dbname))
+    return buffer
+
+
+def record_decision(env, event, result, username, topic=None, action=None, reason=None):
+    """
+    Queue an auth/ACL decision for the audit log
+
+    Denials and errors are always recorded, allowed decisions are sampled
+    according to the ``iot_base.audit_allow_sample_rate`` system parameter.
+
+    Args:
+        env: Environment of the current request (only used to read settings)
+        event: 'auth' or 'acl'
+        result: 'allow', 'deny' or 'ignore'
+        username: MQTT username of the client
+        topic: MQTT topic (ACL only)
+        action: 'publish' or 'subscribe' (ACL only)
+        reason: Short explanation of the decision
+    """
+    if result == "allow":
+        sample_rate = float(
+            env["ir.config_parameter"]
+            .sudo()
+            .get_param("iot_base.audit_allow_sample_rate", 0.1)
+        )
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return
+    get_buffer(env.cr.dbname).push(
+        (fields.Datetime.now(), event, result, username, topic, action, reason)
+    )
@@ -0,0 +1,240 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .config import get_option
+
+_logger = logging.getLogger(__name__)
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class AdmissionRejected(Exception):
+    """Raised when too many database lookups are already running in the worker"""
+
+
+class _Call:
+    """Database lookup shared by all concurrent callers of the same key"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class AuthCache:
+    """
+    Per-process cache of credentials and their permissions for one database
+
+    Used by the EMQX authentication/authorization endpoints to absorb broker
+    reconnect storms:
+
+    - Single-flight: concurrent lookups for the same username wait for the one
+      database fetch already in progress instead of issuing their own
+    - Admission control: at most ``max_concurrency`` fetches run at the same
+      time in the worker, extra ones are rejected after ``admission_timeout``
+      seconds with :class:`AdmissionRejected`
+    - Warm-up: :meth:`fill` loads snapshots in bulk when the registry starts,
+      and again in each worker process forked afterwards (see
+      :meth:`needs_warmup`), so recycled workers do not start cold
+
+    Entries expire after ``ttl`` seconds, which bounds how long other workers
+    may serve data changed elsewhere. Changes made in this worker are applied
+    on commit through :func:`invalidate`. Expired entries are kept for another
+    ``stale_ttl`` seconds and served only when they cannot be reloaded because
+    the worker is overloaded: during a reconnect storm a client may be judged
+    on data up to ``ttl + stale_ttl`` seconds old rather than be rejected.
+    Unknown usernames are cached too, in a separate and smaller map, so
+    repeated attempts with a bad username do not reach the database either.
+    Both maps are bounded and evict the least recently used entries, so random
+    usernames cannot grow worker memory.
+
+    Tuning options (Odoo server configuration file):
+
+    - ``iot_auth_cache_ttl`` (default 60)
+    - ``iot_auth_stale_ttl`` (default 600, 0 never serves stale entries)
+    - ``iot_auth_max_concurrency`` (default 4)
+    - ``iot_auth_admission_timeout`` (default 2.0)
+    - ``iot_auth_coalesce_timeout`` (default 10.0)
+    - ``iot_auth_warmup_limit`` (default 50000, 0 disables warm-up)
+    - ``iot_auth_cache_size`` (default 100000)
+    - ``iot_auth_negative_cache_size`` (default 10000)
+    """
+
+    def __init__(self, dbname):
+        self.dbname = dbname
+        self.ttl = get_option("iot_auth_cache_ttl", 60, int)
+        self.stale_ttl = get_option("iot_auth_stale_ttl", 600, int)
+        self.admission_timeout = get_option("iot_auth_admission_timeout", 2.0, float)
+        self.warmup_limit = get_option("iot_auth_warmup_limit", 50000, int)
+        self.coalesce_timeout = get_option("iot_auth_coalesce_timeout", 10.0, float)
+        self._admission = threading.BoundedSemaphore(
+            get_option("iot_auth_max_concurrency", 4, int)
+        )
+        self.max_entries = get_option("iot_auth_cache_size", 100000, int)
+        self.max_misses = get_option("iot_auth_negative_cache_size", 10000, int)
+        self._entries = OrderedDict()
+        self._misses = OrderedDict()
+        self._inflight = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._warmup_lock = threading.Lock()
+        self._warm_pid = None
+
+    def get(self, username, loader):
+        """
+        Return the snapshot of ``username``, loading it on a cache miss
+
+        Args:
+            username: MQTT username
+            loader: Callable taking the username and returning its snapshot
+                (or None if unknown), only called by one caller at a time
+
+        Returns:
+            dict or None: Snapshot as returned by ``loader``
+        """
+        with self._lock:
+            found, snapshot, stale = self._lookup(username)
+            if found:
+                return snapshot
+            call = self._inflight.get(username)
+            leader = call is None
+            if leader:
+                call = self._inflight[username] = _Call()
+            generation = self._generation
+
+        if not leader:
+            if not call.done.wait(self.coalesce_timeout):
+                if stale:
+                    return stale[0]
+                raise AdmissionRejected(username)
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            if not self._admission.acquire(timeout=self.admission_timeout):
+                if stale:
+                    # Overloaded: an expired answer beats no answer
+                    call.result = stale[0]
+                    return call.result
+                raise AdmissionRejected(username)
+            try:
+                call.result = loader(username)
+            finally:
+                self._admission.release()
+            with self._lock:
+                # Do not store data read before a concurrent invalidation
+                if generation == self._generation:
+                    self._store(username, call.result)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(username, None)
+            call.done.set()
+
+    def _lookup(self, username):
+        """
+        Find the entry of ``username`` (caller holds the lock)
+
+        Returns:
+            tuple: (found, snapshot, stale) where ``stale`` is a 1-tuple
+            holding an expired snapshot that may still be served, or None
+        """
+        now = time.monotonic()
+        for entries in (self._entries, self._misses):
+            entry = entries.get(username)
+            if entry is None:
+                continue
+            expires_at, snapshot = entry
+            if expires_at > now:
+                entries.move_to_end(username)
+                return True, snapshot, None
+            if expires_at + self.stale_ttl > now:
+                return False, None, (snapshot,)
+            del entries[username]
+        return False, None, None
+
+    def _store(self, username, snapshot):
+        """Store an entry, evicting the least recently used (caller holds lock)"""
+        if snapshot is None:
+            entries, max_size = self._misses, self.max_misses
+            self._entries.pop(username, None)
+        else:
+            entries, max_size = self._entries, self.max_entries
+            self._misses.pop(username, None)
+        entries[username] = (time.monotonic() + self.ttl, snapshot)
+        entries.move_to_end(username)
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+
+    def needs_warmup(self):
+        """Whether the current process has not been warmed yet"""
+        return self.warmup_limit > 0 and self._warm_pid != os.getpid()
+
+    def warm_up(self, loader):
+        """
+        Run ``loader`` once per process to preload the cache
+
+        Only one thread warms the process; the others carry on without waiting.
+
+        Args:
+            loader: Callable filling the cache through :meth:`fill`
+        """
+        if not self.needs_warmup() or not self._warmup_lock.acquire(blocking=False):
+            return
+        try:
+            if self.needs_warmup():
+                loader()
+        finally:
+            # Also on failure: a broken warm-up must not run on every request
+            self._warm_pid = os.getpid()
+            self._warmup_lock.release()
+
+    def fill(self, snapshots):
+        """Store preloaded snapshots, keyed by username"""
+        with self._lock:
+            for username, snapshot in snapshots.items():
+                self._store(username, snapshot)
+
+    def discard(self, usernames=None):
+        """Forget the given usernames, or everything if None"""
+        with self._lock:
+            self._generation += 1
+            if usernames is None:
+                self._entries.clear()
+                self._misses.clear()
+            else:
+                for username in usernames:
+                    self._entries.pop(username, None)
+                    self._misses.pop(username, None)
+
+
+def get_cache(dbname):
+    """Return the auth cache of ``dbname`` for the current process"""
+    cache = _caches.get(dbname)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(dbname, AuthCache(dbname))
+    return cache
+
+
+def invalidate(env, usernames=None):
+    """
+    Discard cached snapshots once the current transaction is committed
+
+    Args:
+        env: Environment whose transaction changes credentials/permissions
+        usernames: Usernames to discard, or None to discard everything
+    """
+    cache = get_cache(env.cr.dbname)
+    usernames = None if usernames is None else set(filter(None, usernames))
+    if usernames is not None and not usernames:
+        return
+    env.cr.postcommit.add(lambda: cache.discard(usernames))
@@ -0,0 +1,16 @@
+from odoo.tools import config
+
+
+def get_option(key, default, cast):
+    """
+    Read a per-process tuning option from the Odoo server configuration
+
+    Args:
+        key: Option name in the ``[options]`` section of the config file
+        default: Value used when the option is missing or invalid
+        cast: Type to convert the option to (options are read as strings)
+    """
+    try:
+        return cast(config.get(key) or default)
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,85 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from odoo import SUPERUSER_ID, api
+from odoo.modules.registry import Registry
+
+_logger = logging.getLogger(__name__)
+
+
+class BackgroundFlusher:
+    """
+    Base class for per-process buffers drained by a daemon thread
+
+    Subclasses accumulate data in memory from the request path, hand it over
+    with ``_take()`` and write it to the database in one go with
+    ``_flush(env, data)``. The flusher thread is started lazily on first use and
+    restarted after a fork, so it works the same in threaded mode and in prefork
+    workers. Pending data is flushed once more when the process exits.
+
+    Subclasses setting ``flush_when_idle`` are flushed every interval even
+    without pending data, e.g. to refresh state read back from the database.
+
+    Args:
+        dbname: Database the buffered data belongs to
+        interval: Seconds between two flushes
+    """
+
+    flush_when_idle = False
+
+    def __init__(self, dbname, interval):
+        self.dbname = dbname
+        self.interval = interval
+        self._pid = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the flusher thread for the current process if needed"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._reset()
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f"{type(self).__name__}-{self.dbname}",
+                daemon=True,
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.flush)
+
+    def _reset(self):
+        """Drop state inherited from a parent process (hook for subclasses)"""
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """Flush buffered data in a dedicated cursor, never raising"""
+        data = self._take()
+        if not data and not self.flush_when_idle:
+            return
+        try:
+            with Registry(self.dbname).cursor() as cr:
+                self._flush(api.Environment(cr, SUPERUSER_ID, {}), data)
+        except Exception:
+            _logger.exception("%s: flush failed", type(self).__name__)
+            self._discard(data)
+
+    def _take(self):
+        """Detach and return the data to flush, or a falsy value if none"""
+        raise NotImplementedError
+
+    def _flush(self, env, data):
+        raise NotImplementedError
+
+    def _discard(self, data):
+        """Called with the data of a failed flush (hook for subclasses)"""
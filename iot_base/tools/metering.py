@@ -0,0 +1,226 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from .config import get_option
+from .flusher import BackgroundFlusher
+
+_logger = logging.getLogger(__name__)
+
+DIRECTIONS = ("sdata", "acdata")
+EPOCH = datetime(1970, 1, 1)
+# Largest payload an MQTT packet can carry (maximum remaining length)
+MAX_PAYLOAD_SIZE = 268435455
+
+_meters = {}
+_meters_lock = threading.Lock()
+
+
+def bucket_start(timestamp, bucket_seconds):
+    """Start of the time bucket ``timestamp`` (naive UTC datetime) falls in"""
+    seconds = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % bucket_seconds)
+
+
+class DeviceMeter(BackgroundFlusher):
+    """
+    Per-process aggregation of device traffic for one database
+
+    Message and byte counts are summed in memory per (company, device UID,
+    direction, publisher, time bucket) and periodically added to
+    ``iot.device.meter`` with additive upserts, so concurrent workers never
+    overwrite each other's counts. Sensor data (sdata) is only charged to a
+    device when the device itself published it.
+
+    Every flush also reads back today's usage of the devices that have a
+    quota, which lets :meth:`is_over_quota` answer from memory. Usage counted
+    locally stays pending until the flush that wrote it has installed the new
+    usage, and is kept for the next flush if that one fails. Flushes run even
+    without local traffic so workers that only serve authorization requests
+    still see usage recorded by the others.
+
+    Tuning options (Odoo server configuration file):
+
+    - ``iot_meter_bucket_seconds`` (default 300)
+    - ``iot_meter_flush_interval`` (default 10.0)
+    """
+
+    flush_when_idle = True
+
+    def __init__(self, dbname):
+        super().__init__(dbname, get_option("iot_meter_flush_interval", 10.0, float))
+        self.bucket_seconds = get_option("iot_meter_bucket_seconds", 300, int)
+        self._lock = threading.Lock()
+        self._counts = {}
+        # sdata usage per (device UID, publisher) not yet in _quotas: counted
+        # since the last take, and taken by the flush in progress
+        self._pending = {}
+        self._flushing = {}
+        self._quotas = {}
+
+    def _reset(self):
+        self._counts = {}
+        self._pending = {}
+        self._flushing = {}
+
+    def record(self, company, device_uid, direction, username, size, timestamp):
+        """
+        Count one message
+
+        Args:
+            company: First topic level, the company ID of the device
+            device_uid: UID of the device the topic belongs to
+            direction: 'sdata' or 'acdata'
+            username: MQTT username of the publisher, if known
+            size: Payload size in bytes
+            timestamp: Naive UTC datetime of the message
+        """
+        self.ensure_started()
+        key = (
+            company,
+            device_uid,
+            direction,
+            username,
+            bucket_start(timestamp, self.bucket_seconds),
+        )
+        with self._lock:
+            _add_usage(self._counts, key, 1, size)
+            if direction == "sdata":
+                _add_usage(self._pending, (device_uid, username), 1, size)
+
+    def is_over_quota(self, device_uid, username):
+        """
+        Whether the device already used its daily publish quota
+
+        Answers from memory only: usage read back at the last flush plus the
+        messages the device published since then in this worker.
+
+        Args:
+            device_uid: UID of the device
+            username: MQTT username of the device's credential
+        """
+        self.ensure_started()
+        key = (device_uid, username)
+        with self._lock:
+            quota = self._quotas.get(device_uid)
+            if not quota:
+                return False
+            message_quota, byte_quota, messages, size = quota
+            for usage in (self._pending, self._flushing):
+                messages += usage.get(key, (0, 0))[0]
+                size += usage.get(key, (0, 0))[1]
+        return bool(
+            (message_quota and messages >= message_quota)
+            or (byte_quota and size >= byte_quota)
+        )
+
+    def _take(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            for key, (messages, size) in self._pending.items():
+                _add_usage(self._flushing, key, messages, size)
+            self._pending = {}
+        return counts
+
+    def _flush(self, env, data):
+        meters = env["iot.device.meter"]
+        meters._add_counts(data)
+        quotas = meters._read_quota_usage()
+        env.cr.commit()
+        # The new usage includes what was taken: stop counting it twice
+        with self._lock:
+            self._quotas = quotas
+            self._flushing = {}
+
+    def _discard(self, data):
+        with self._lock:
+            for key, (messages, size) in data.items():
+                _add_usage(self._counts, key, messages, size)
+            for key, (messages, size) in self._flushing.items():
+                _add_usage(self._pending, key, messages, size)
+            self._flushing = {}
+        _logger.warning(
+            "IoT metering flush failed, %s counters kept for the next flush",
+            len(data),
+        )
+
+
+def _add_usage(usage, key, messages, size):
+    """Add to the [messages, bytes] counter of ``key`` in ``usage``"""
+    counter = usage.setdefault(key, [0, 0])
+    counter[0] += messages
+    counter[1] += size
+
+
+def get_meter(dbname):
+    """Return the device meter of ``dbname`` for the current process"""
+    meter = _meters.get(dbname)
+    if meter is None:
+        with _meters_lock:
+            meter = _meters.setdefault(dbname, DeviceMeter(dbname))
+    return meter
+
+
+def parse_topic(topic):
+    """
+    Extract the company, device UID and direction of a device topic
+
+    Topics follow ``{company_id}/{device_uid}/{data_type}/[sdata|acdata]``.
+
+    Returns:
+        tuple: (company, device_uid, direction), or None for other topics
+    """
+    parts = (topic or "").split("/")
+    if len(parts) < 4 or parts[-1] not in DIRECTIONS or not all(parts[:2]):
+        return None
+    return parts[0], parts[1], parts[-1]
+
+
+def parse_message(message, default_timestamp):
+    """
+    Validate a 'message.publish' event and extract what the meter records
+
+    Args:
+        message: Event as sent by EMQX
+        default_timestamp: Naive UTC datetime used when the event has none
+
+    Returns:
+        tuple: (company, device_uid, direction, username, size, timestamp), or
+        None for messages on topics that are not device topics
+
+    Raises:
+        TypeError: If the event or one of its fields has the wrong type
+        ValueError: If the payload size or the timestamp is out of range
+    """
+    if not isinstance(message, dict):
+        raise TypeError("Message must be an object")
+    device_topic = parse_topic(message.get("topic"))
+    if not device_topic:
+        return None
+    company, device_uid, direction = device_topic
+
+    username = message.get("username")
+    if username is not None and not isinstance(username, str):
+        raise TypeError("username must be a string")
+
+    size = message.get("payload_size")
+    if size is None:
+        size = len(str(message.get("payload") or "").encode())
+    elif isinstance(size, bool) or not isinstance(size, int):
+        raise TypeError("payload_size must be an integer")
+    if not 0 <= size <= MAX_PAYLOAD_SIZE:
+        raise ValueError("payload_size out of range")
+
+    timestamp = message.get("timestamp")
+    if timestamp is None:
+        timestamp = default_timestamp
+    elif isinstance(timestamp, bool) or not isinstance(timestamp, int | float):
+        raise TypeError("timestamp must be a number of milliseconds")
+    else:
+        try:
+            timestamp = datetime.fromtimestamp(timestamp / 1000, timezone.utc)
+        except (OverflowError, OSError, ValueError) as e:
+            raise ValueError("timestamp out of range") from e
+        timestamp = timestamp.replace(tzinfo=None)
+
+    return company, device_uid, direction, username or None, size, timestamp